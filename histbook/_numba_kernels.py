@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2018, DIANA-HEP
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Optional Numba-compiled kernels for the fill hot path.
+
+If Numba is not installed, ``available`` is ``False`` and callers fall back
+to the pure Numpy implementation; histbook does not require Numba.
+"""
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+available = numba is not None
+
+if available:
+    @numba.njit(nogil=True, cache=True)
+    def scatteradd2(indexes, values1, values2, flat, column1, column2):
+        """Scatter-add two value arrays (e.g. ``weight`` and ``weight**2``, or a profile's ``wx`` and ``wx**2``) into two columns of ``flat`` in a single pass over events."""
+        for i in range(indexes.shape[0]):
+            j = indexes[i]
+            flat[j, column1] += values1[i]
+            flat[j, column2] += values2[i]
+
+    @numba.njit(nogil=True, cache=True)
+    def scatteradd2masked(indexes, mask, values1, values2, flat, column1, column2):
+        """Like ``scatteradd2``, but skips events whose ``mask`` is set (no rewritten copy of the index array)."""
+        for i in range(indexes.shape[0]):
+            if not mask[i]:
+                j = indexes[i]
+                flat[j, column1] += values1[i]
+                flat[j, column2] += values2[i]
@@ -36,6 +36,7 @@ import threading
 
 import numpy
 
+import histbook.calc.cuda
 import histbook.calc.spark
 import histbook.fill
 import histbook.hist
@@ -537,6 +538,16 @@ class Book(GenericBook, histbook.fill.Fillable):
             x._streamline(i, instructions)
         return instructions
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # the compiled fill program holds closures and references into the histograms' destination buffers; rebuild it on demand after unpickling
+        state["_fields"] = None
+        state.pop("_instructions", None)
+        state.pop("_params", None)
+        state.pop("_compiled", None)
+        state.pop("_destination", None)
+        return state
+
     def fill(self, arrays=None, **more):
         u"""
         Fill the histograms: identify bins for independent variables, increase their counts by ``1`` or ``weight``, and increment any profile (dependent variable) means and errors in the means.
@@ -570,6 +581,21 @@ class Book(GenericBook, histbook.fill.Fillable):
                 raise TypeError("if arrays is a Pandas DataFrame, keyword arguments are not allowed")
             self.fill(dict((n, arrays[n].values) for n in arrays.columns))
 
+        elif histbook.calc.cuda.iscuda(arrays, more):
+            # dict-like of cupy.ndarray
+            if arrays is None:
+                arrays = dict(more)
+            elif len(more) > 0:
+                arrays = dict(arrays)
+                arrays.update(more)
+            converted = None
+            for x in self.itervalues(recursive=True, onlyhist=True):
+                x._prefill()
+                if not histbook.calc.cuda.fillcuda(x, arrays):
+                    if converted is None:
+                        converted = histbook.calc.cuda.asnumpy(arrays)
+                    x.fill(converted)
+
         else:
             # dict-like of numpy.ndarray (or castable)
             if arrays is None:
@@ -579,11 +605,35 @@ class Book(GenericBook, histbook.fill.Fillable):
             else:
                 arrays = histbook.util.ChainedDict(arrays, more)
 
-            for x in self.itervalues(recursive=True, onlyhist=True):
+            hists = list(self.itervalues(recursive=True, onlyhist=True))
+            for x in hists:
                 x._prefill()
-            length = self._fill(arrays)
-            for x in self.itervalues(recursive=True, onlyhist=True):
-                x._postfill(arrays, length)
+
+            if len(hists) == 1:
+                for block in self._blocks(arrays):
+                    length = self._fill(block)
+                    hists[0]._postfill(block, length)
+            else:
+                # each histogram only writes its own content, so their fills can run
+                # concurrently (the compiled kernels and most Numpy ops release the GIL)
+                errors = []
+                def postfill(x, block, length):
+                    def task():
+                        try:
+                            x._postfill(block, length)
+                        except Exception as err:
+                            errors.append(err)    # threading.Thread would only print it; re-raised after join
+                    return task
+
+                for block in self._blocks(arrays):
+                    length = self._fill(block)
+                    threads = [threading.Thread(target=postfill(x, block, length)) for x in hists]
+                    for x in threads:
+                        x.start()
+                    for x in threads:
+                        x.join()
+                    if len(errors) != 0:
+                        raise errors[0]
 
 ################################################################ for constructing fillable views
 
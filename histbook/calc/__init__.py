@@ -211,6 +211,21 @@ def histbook_bin(underflow, overflow, nanflow, closedlow):
     else:
         shift = 0
 
+    if underflow and overflow and nanflow and closedlow:
+        # fast path for the default flags: clipping the scaled values to [-1, numbins] before
+        # the integer cast makes truncation equivalent to floor and subsumes both range clamps
+        def bin(values, numbins, low, high):
+            indexes = values - float(low)
+            numpy.multiply(indexes, float(numbins) / float(high - low), indexes)
+            numpy.clip(indexes, -1.0, numbins, indexes)
+            numpy.add(indexes, shift, indexes)
+            with numpy.errstate(invalid="ignore"):
+                out = numpy.ma.array(indexes, dtype=INDEXTYPE)
+                out[numpy.isnan(indexes)] = nanindex + numbins
+            return out
+
+        return bin
+
     def bin(values, numbins, low, high):
         indexes = values - float(low)
         numpy.multiply(indexes, float(numbins) / float(high - low), indexes)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2018, DIANA-HEP
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import histbook.axis
+import histbook.expr
+
+def _isdevicearray(x):
+    return x.__class__.__name__ == "ndarray" and x.__class__.__module__.split(".")[0] == "cupy"
+
+def iscuda(arrays, more):
+    """Returns ``True`` if any of the fill values is a CuPy device array."""
+    def hasdevice(d):
+        if d is None:
+            return False
+        try:
+            values = list(d.values())
+        except AttributeError:
+            return False
+        return any(_isdevicearray(x) for x in values)
+    return hasdevice(arrays) or hasdevice(more)
+
+def asnumpy(arrays):
+    """Copy any CuPy device arrays in ``arrays`` to the host, for the fallback fill path."""
+    import cupy
+    return dict((n, cupy.asnumpy(arrays[n]) if _isdevicearray(arrays[n]) else arrays[n]) for n in arrays)
+
+def fillcuda(hist, arrays):
+    """
+    Fill ``hist`` from CuPy device arrays, binning and aggregating on the GPU and transferring only the dense bin contents to the host.
+
+    Only the common configuration is computed on the device: fixed :py:class:`bin <histbook.axis.bin>` axes with default flow flags whose expressions are plain field names, and a weight that is ``None`` or a plain field name. Returns ``False`` if this histogram needs the host path instead.
+    """
+    import cupy
+
+    if len(hist._group) != 0 or len(hist._profile) != 0 or len(hist._fixed) == 0:
+        return False
+
+    if hist._weightparsed is None:
+        weightname = None
+    elif isinstance(hist._weightparsed, (histbook.expr.Name, histbook.expr.Predicate)):
+        weightname = hist._weightparsed.value
+    else:
+        return False
+
+    for axis in hist._fixed:
+        if not (isinstance(axis, histbook.axis.bin) and axis.underflow and axis.overflow and axis.nanflow and axis.closedlow and isinstance(axis._parsed, histbook.expr.Name)):
+            return False
+
+    indexes = None
+    for axis in hist._fixed:
+        try:
+            values = cupy.asarray(arrays[axis._parsed.value], dtype=cupy.float64)
+        except KeyError:
+            raise ValueError("required field {0} not found in fill arguments".format(repr(str(axis._parsed))))
+
+        numbins = axis.numbins
+        # same arithmetic as the uniform-bin fast path in histbook.calc
+        onedim = (values - float(axis.low)) * (float(numbins) / (float(axis.high) - float(axis.low)))
+        onedim = cupy.clip(onedim, -1.0, numbins) + 1.0
+        nan = cupy.isnan(onedim)
+        onedim = onedim.astype(cupy.int64)
+        onedim[nan] = numbins + 2
+
+        if indexes is None:
+            indexes = onedim
+        else:
+            indexes = indexes * axis.totbins + onedim
+
+    flat = hist._content.reshape((-1, hist._shape[-1]))
+    n = flat.shape[0]
+
+    if weightname is None:
+        flat[:, hist._sumwindex] += cupy.asnumpy(cupy.bincount(indexes, minlength=n))
+    else:
+        try:
+            weight = cupy.asarray(arrays[weightname], dtype=cupy.float64)
+        except KeyError:
+            raise ValueError("required field {0} not found in fill arguments".format(repr(weightname)))
+        weight = cupy.where(cupy.isnan(weight), 0.0, weight)
+        flat[:, hist._sumwindex] += cupy.asnumpy(cupy.bincount(indexes, weights=weight, minlength=n))
+        flat[:, hist._sumw2index] += cupy.asnumpy(cupy.bincount(indexes, weights=weight * weight, minlength=n))
+
+    return True
@@ -35,6 +35,18 @@ import histbook.expr
 import histbook.instr
 import histbook.util
 
+CHUNKSIZE = 1048576    # events per block: bounds the temporary arrays' working set during a fill
+
+def _full(length, value):
+    if isinstance(value, (histbook.util.string, bytes)):
+        value = numpy.array(value)
+    if isinstance(value, numpy.ndarray) and value.shape == () and (value.dtype.kind == "U" or value.dtype.kind == "S"):
+        out = numpy.empty(length, dtype=value.dtype)
+        out[:] = value
+        return out
+    else:
+        return numpy.full(length, value)
+
 class Fillable(object):
     """Mix-in for objects with a ``fill`` method, like `Hist <histbook.hist.Hist>` and `Book <histbook.hist.Book>`."""
 
@@ -50,14 +62,76 @@ class Fillable(object):
                 x.clear()
             for x in goals:
                 x.grow(table)
-            
+
             fields = histbook.instr.sources(goals, table)
 
             self._instructions = self._streamline(0, list(histbook.instr.instructions(fields, goals)))
             self._fields = sorted(x.goal.value for x in fields)
+            self._params = [(x.name, x.extern) for x in self._instructions if isinstance(x, histbook.instr.Param) and not isinstance(x.extern, histbook.expr.BroadcastConst)]
+            self._compiled = [self._compilestep(x) for x in self._instructions]
 
         return self._fields
 
+    def _compilestep(self, instruction):
+        """Specialize ``instruction`` into a closure, so that filling doesn't re-dispatch on the instruction type for every call."""
+
+        if isinstance(instruction, histbook.instr.Param):
+            name = instruction.name
+            extern = instruction.extern
+
+            if isinstance(extern, histbook.expr.BroadcastConst):
+                value = extern.value
+                def step(arrays, symbols, length, firstinstruction, firstarray):
+                    symbols[name] = _full(length, value)
+
+            else:
+                value = extern.value
+                def step(arrays, symbols, length, firstinstruction, firstarray):
+                    if name == firstinstruction:
+                        array = firstarray
+                    else:
+                        try:
+                            array = arrays[value]
+                        except KeyError:
+                            if value in histbook.expr.Expr.maybeconstants:
+                                array = _full(length, histbook.expr.Expr.maybeconstants[value])
+                            else:
+                                raise ValueError("required field {0} not found in fill arguments".format(repr(str(extern))))
+
+                    if not isinstance(array, numpy.ndarray):
+                        array = numpy.array(array)
+                    if array.shape == ():
+                        array = _full(length, array)
+
+                    if length != array.shape[0]:
+                        raise ValueError("array {0} has len {1} but other arrays have len {2}".format(repr(str(extern)), len(array), length))
+
+                    symbols[name] = array
+
+        elif isinstance(instruction, histbook.instr.Assign):
+            name = instruction.name
+            expr = instruction.expr
+            def step(arrays, symbols, length, firstinstruction, firstarray):
+                symbols[name] = histbook.calc.calculate(expr, symbols)
+
+        elif isinstance(instruction, histbook.instr.Export):
+            name = instruction.name
+            destination = instruction.destination
+            def step(arrays, symbols, length, firstinstruction, firstarray):
+                data = symbols[name]
+                for i, j in destination:
+                    self._destination[i][j] = data
+
+        elif isinstance(instruction, histbook.instr.Delete):
+            name = instruction.name
+            def step(arrays, symbols, length, firstinstruction, firstarray):
+                del symbols[name]
+
+        else:
+            raise AssertionError(instruction)
+
+        return step
+
     def _showgoals(self):
         self.fields  # for the side-effect of creating self._instructions
 
@@ -82,81 +156,68 @@ class Fillable(object):
             print(instruction)
         print("")
         
+    def _blocks(self, arrays):
+        """Yield ``arrays`` in blocks of at most ``CHUNKSIZE`` events, so that the temporaries of each block fit in cache."""
+        length = None
+        for n in self.fields:
+            try:
+                x = arrays[n]
+            except KeyError:
+                continue
+            if isinstance(x, numpy.ndarray) and x.shape != ():
+                length = x.shape[0]
+                break
+
+        if length is None or length <= CHUNKSIZE:
+            yield arrays
+        else:
+            # check lengths before yielding any block: a mismatched array must not fill partially
+            # (and one whose length happens to equal the block length must not be reused per block)
+            for n in self.fields:
+                try:
+                    x = arrays[n]
+                except KeyError:
+                    continue
+                if isinstance(x, (histbook.util.string, bytes)):
+                    continue
+                try:
+                    xlen = len(x)
+                except TypeError:
+                    continue
+                if xlen != length:
+                    raise ValueError("array {0} has len {1} but other arrays have len {2}".format(repr(str(n)), xlen, length))
+
+            for start in range(0, length, CHUNKSIZE):
+                yield histbook.util.SlicedDict(arrays, length, start, min(start + CHUNKSIZE, length))
+
     def _fill(self, arrays):
-        self.fields  # for the side-effect of creating self._instructions
-        
+        self.fields  # for the side-effect of creating self._compiled
+
         length = None
         firstinstruction = None
         firstarray = None
-        for instruction in self._instructions:
-            if isinstance(instruction, histbook.instr.Param) and not isinstance(instruction.extern, histbook.expr.BroadcastConst):
-                try:
-                    array = arrays[instruction.extern.value]
-                except KeyError:
-                    if instruction.extern.value in histbook.expr.Expr.maybeconstants:
-                        continue
-                    else:
-                        raise ValueError("required field {0} not found in fill arguments".format(repr(str(instruction.extern))))
+        for name, extern in self._params:
+            try:
+                array = arrays[extern.value]
+            except KeyError:
+                if extern.value in histbook.expr.Expr.maybeconstants:
+                    continue
+                else:
+                    raise ValueError("required field {0} not found in fill arguments".format(repr(str(extern))))
 
-                if not isinstance(array, numpy.ndarray):
-                    array = numpy.array(array)
-                if array.shape != ():
-                    length = array.shape[0]
-                    firstinstruction = instruction.name
-                    firstarray = array
-                    break
+            if not isinstance(array, numpy.ndarray):
+                array = numpy.array(array)
+            if array.shape != ():
+                length = array.shape[0]
+                firstinstruction = name
+                firstarray = array
+                break
 
         if length is None:
             length = 1
 
-        def full(length, value):
-            if isinstance(value, (histbook.util.string, bytes)):
-                value = numpy.array(value)
-            if isinstance(value, numpy.ndarray) and value.shape == () and (value.dtype.kind == "U" or value.dtype.kind == "S"):
-                out = numpy.empty(length, dtype=value.dtype)
-                out[:] = value
-                return out
-            else:
-                return numpy.full(length, value)
-
         symbols = {}
-        for instruction in self._instructions:
-            if isinstance(instruction, histbook.instr.Param):
-                if isinstance(instruction.extern, histbook.expr.BroadcastConst):
-                    array = full(length, instruction.extern.value)
-                elif instruction.name == firstinstruction:
-                    array = firstarray
-                else:
-                    try:
-                        array = arrays[instruction.extern.value]
-                    except KeyError:
-                        if instruction.extern.value in histbook.expr.Expr.maybeconstants:
-                            array = full(length, histbook.expr.Expr.maybeconstants[instruction.extern.value])
-                        else:
-                            raise ValueError("required field {0} not found in fill arguments".format(repr(str(instruction.extern))))
-
-                if not isinstance(array, numpy.ndarray):
-                    array = numpy.array(array)
-                if array.shape == ():
-                    array = full(length, array)
-
-                if length != array.shape[0]:
-                    raise ValueError("array {0} has len {1} but other arrays have len {2}".format(repr(str(instruction.extern)), len(array), length))
-
-                symbols[instruction.name] = array
-
-            elif isinstance(instruction, histbook.instr.Assign):
-                symbols[instruction.name] = histbook.calc.calculate(instruction.expr, symbols)
-
-            elif isinstance(instruction, histbook.instr.Export):
-                data = symbols[instruction.name]
-                for i, j in instruction.destination:
-                    self._destination[i][j] = data
-
-            elif isinstance(instruction, histbook.instr.Delete):
-                del symbols[instruction.name]
-
-            else:
-                raise AssertionError(instruction)
+        for step in self._compiled:
+            step(arrays, symbols, length, firstinstruction, firstarray)
 
         return length
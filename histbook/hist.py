@@ -29,13 +29,16 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import collections
+import multiprocessing
 import numbers
 import threading
 
 import numpy
 
+import histbook._numba_kernels
 import histbook.axis
 import histbook.calc
+import histbook.calc.cuda
 import histbook.calc.spark
 import histbook.export
 import histbook.expr
@@ -45,6 +48,40 @@ import histbook.instr
 import histbook.util
 import histbook.vega
 
+FILLTHREADS = multiprocessing.cpu_count()
+PARALLELMIN = 1024**2        # number of events below which threading overhead dominates
+
+def _bincount(indexes, weights, minlength):
+    """Like ``numpy.bincount``, but large fills are split across ``FILLTHREADS`` private histograms that are sum-reduced at the end (avoiding contention on shared bins)."""
+    if FILLTHREADS <= 1 or indexes.shape[0] < PARALLELMIN:
+        return numpy.bincount(indexes, weights=weights, minlength=minlength)
+
+    step = -(-indexes.shape[0] // FILLTHREADS)
+    local = numpy.zeros((FILLTHREADS, minlength), dtype=numpy.float64)
+    errors = []
+
+    def fillchunk(i):
+        def task():
+            try:
+                chunk = indexes[i*step : (i + 1)*step]
+                if chunk.shape[0] > 0:
+                    if weights is None:
+                        local[i] = numpy.bincount(chunk, minlength=minlength)
+                    else:
+                        local[i] = numpy.bincount(chunk, weights=weights[i*step : (i + 1)*step], minlength=minlength)
+            except Exception as err:
+                errors.append(err)    # threading.Thread would only print it; re-raised after join
+        return task
+
+    threads = [threading.Thread(target=fillchunk(i)) for i in range(FILLTHREADS)]
+    for x in threads:
+        x.start()
+    for x in threads:
+        x.join()
+    if len(errors) != 0:
+        raise errors[0]
+    return local.sum(axis=0)
+
 class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Exportable, histbook.vega.PlottingChain):
     COUNTTYPE = numpy.float64
 
@@ -58,15 +95,15 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
 
     def weight(self, expr):
         """Returns a copy of this histogram with ``expr`` as weights (for fluent construction)."""
-        return Hist(*(self._group + self._fixed + self._profile), weight=expr, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment))
+        return Hist(*(self._group + self._fixed + self._profile), weight=expr, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment), counttype=self.COUNTTYPE)
 
     def filter(self, expr):
         """Returns a copy of this histogram with ``expr`` as filter (for fluent construction)."""
-        return Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=expr, defs=dict(self._defs), attachment=dict(self._attachment))
+        return Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=expr, defs=dict(self._defs), attachment=dict(self._attachment), counttype=self.COUNTTYPE)
 
     def systematic(self, vector):
         """Returns a copy of this histogram with ``vector`` as systematic (for fluent construction)."""
-        return Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment), systematic=vector)
+        return Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment), systematic=vector, counttype=self.COUNTTYPE)
 
     @classmethod
     def _copycontent(cls, content):
@@ -79,13 +116,13 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
 
     def copy(self):
         """Return an immediate copy of the histogram."""
-        out = Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment))
+        out = Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment), counttype=self.COUNTTYPE)
         out._content = self.__class__._copycontent(self._content)
         return out
 
     def copyonfill(self):
         """Return a copy of the histogram whose content is copied if filled."""
-        out = Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment))
+        out = Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment), counttype=self.COUNTTYPE)
         out._copyonfill = True
         out._content = self._content
         return out
@@ -96,7 +133,7 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
 
     def cleared(self):
         """Return a copy with all bins set to zero."""
-        return Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment))        
+        return Hist(*(self._group + self._fixed + self._profile), weight=self._weightoriginal, filter=self._filteroriginal, defs=dict(self._defs), attachment=dict(self._attachment), counttype=self.COUNTTYPE)        
 
     def __init__(self, *axis, **opts):
         u"""
@@ -124,6 +161,9 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
 
         systematic : ``None``, tuple of numbers
             the systematic error vector this histogram represents; a special case of attachment (and stored in attachment)
+
+        counttype : ``None`` or floating-point Numpy dtype
+            if not ``None``, accumulate bin contents with this dtype instead of the default ``numpy.float64``; ``numpy.float32`` halves the memory and memory bandwidth of large histograms at reduced precision
         """
         weight = opts.pop("weight", None)
         filter = opts.pop("filter", None)
@@ -131,9 +171,16 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
         fill = opts.pop("fill", None)
         attachment = opts.pop("attachment", None)
         systematic = opts.pop("systematic", None)
+        counttype = opts.pop("counttype", None)
         if len(opts) > 0:
             raise TypeError("unrecognized options for Hist: {0}".format(" ".join(opts)))
 
+        if counttype is not None:
+            counttype = numpy.dtype(counttype)
+            if counttype.kind != "f":
+                raise TypeError("counttype must be a floating-point dtype, not {0} (weights accumulate fractional counts)".format(repr(str(counttype))))
+            self.COUNTTYPE = counttype.type
+
         if systematic is not None:
             if attachment is None:
                 attachment = {"systematic": systematic}
@@ -253,9 +300,13 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
         self._profile = tuple(self._profile)
 
         self._shape = tuple(self._shape)
+        self._fixeddims = tuple(self._shape[axis._shapeindex] for axis in self._fixed)
+        self._fixedsmall = int(numpy.prod(self._fixeddims, dtype=numpy.int64)) < 2**31
         self._content = None
         self._fields = None
         self._copyonfill = False
+        self._flatcache = None
+        self._constweight = None
 
         if fill is not None:
             if not histbook.calc.spark.isspark(fill, {}) and not isinstance(fill, dict):
@@ -364,6 +415,17 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
                 raise TypeError("if arrays is a Pandas DataFrame, keyword arguments are not allowed")
             self.fill(dict((n, arrays[n].values) for n in arrays.columns))
 
+        elif histbook.calc.cuda.iscuda(arrays, more):
+            # dict-like of cupy.ndarray
+            if arrays is None:
+                arrays = dict(more)
+            elif len(more) > 0:
+                arrays = dict(arrays)
+                arrays.update(more)
+            self._prefill()
+            if not histbook.calc.cuda.fillcuda(self, arrays):
+                self.fill(histbook.calc.cuda.asnumpy(arrays))
+
         else:
             # dict-like of numpy.ndarray (or castable)
             if arrays is None:
@@ -375,8 +437,9 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
 
             self._prefill()
 
-            length = self._fill(arrays)
-            self._postfill(arrays, length)
+            for block in self._blocks(arrays):
+                length = self._fill(block)
+                self._postfill(block, length)
 
     def _prefill(self):
         if self._content is None:
@@ -391,18 +454,58 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
 
     def _postfill(self, arrays, length):
         j = len(self._group)
-        step = 0
         indexes = None
-        for axis in self._fixed:
-            if step == 0:
-                indexes = self._destination[0][j]
-            elif step == 1:
-                indexes = indexes.copy()
-            if step > 0:
-                numpy.multiply(indexes, self._shape[axis._shapeindex], indexes)
-                numpy.add(indexes, self._destination[0][j], indexes)
+        if len(self._fixed) == 1:
+            indexes = self._destination[0][j]
             j += 1
-            step += 1
+
+        elif len(self._fixed) > 1:
+            peraxis = [self._destination[0][j + k] for k in range(len(self._fixed))]
+            j += len(self._fixed)
+
+            if all(numpy.ma.getmask(x) is numpy.ma.nomask for x in peraxis):
+                # one fused pass over the event arrays instead of two passes per axis
+                indexes = numpy.ravel_multi_index([numpy.ma.getdata(x) for x in peraxis], self._fixeddims, mode="clip")
+                if self._fixedsmall and indexes.dtype != histbook.calc.INDEXTYPE:
+                    indexes = indexes.astype(histbook.calc.INDEXTYPE)    # half the bandwidth in the sort/scatter passes
+                indexes = numpy.ma.array(indexes)
+
+            else:
+                # combine the per-axis masks once up front; in-place numpy.ma arithmetic
+                # would re-derive the mask on every multiply and add
+                mask = numpy.bitwise_or(numpy.ma.getmaskarray(peraxis[0]), numpy.ma.getmaskarray(peraxis[1]))
+                if self._fixedsmall:
+                    indexes = numpy.multiply(numpy.ma.getdata(peraxis[0]), self._fixeddims[1])
+                else:
+                    indexes = numpy.multiply(numpy.ma.getdata(peraxis[0]), self._fixeddims[1], dtype=numpy.int64)
+                numpy.add(indexes, numpy.ma.getdata(peraxis[1]), indexes)
+                for dim, onedim in zip(self._fixeddims[2:], peraxis[2:]):
+                    numpy.bitwise_or(mask, numpy.ma.getmaskarray(onedim), mask)
+                    numpy.multiply(indexes, dim, indexes)
+                    numpy.add(indexes, numpy.ma.getdata(onedim), indexes)
+                indexes = numpy.ma.array(indexes, mask=mask)
+
+        if len(self._group) == 0 and len(self._profile) == 0 and self._weightparsed is None:
+            # plain counting histogram: one bincount straight into the sumw column
+            if self._flatcache is not None and self._flatcache[0] is self._content:
+                flat = self._flatcache[1]
+            else:
+                flat = self._content.reshape((-1, self._shape[-1]))
+                self._flatcache = (self._content, flat)
+            n = flat.shape[0]
+
+            if indexes is None:
+                flat[:, self._sumwindex] += 1 if length is None else length
+            else:
+                mask = numpy.ma.getmask(indexes)
+                if mask is numpy.ma.nomask:
+                    flat[:, self._sumwindex] += _bincount(numpy.ma.getdata(indexes), None, n)
+                else:
+                    flat[:, self._sumwindex] += _bincount(numpy.where(mask, n, numpy.ma.getdata(indexes)), None, n + 1)[:n]
+
+            for j in range(len(self._destination[0])):
+                self._destination[0][j] = None
+            return
 
         axissumx, axissumx2 = [], []
         for axis in self._profile:
@@ -414,59 +517,104 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
             weight = 1
             weight2 = None
         elif isinstance(self._weightparsed, histbook.expr.Const):
-            weight = numpy.ones(length) * self._weightparsed.value
-            weight2 = numpy.ones(length) * self._weightparsed.value**2
+            if self._constweight is None or len(self._constweight[0]) != length:
+                self._constweight = (numpy.full(length, self._weightparsed.value, dtype=numpy.float64),
+                                     numpy.full(length, self._weightparsed.value**2, dtype=numpy.float64))
+            weight, weight2 = self._constweight
         else:
             weight = self._destination[0][j]
             weight2 = self._destination[0][j + 1]
-            selection = numpy.isnan(weight)
-            if selection.any():
-                weight = weight.copy()
-                weight2 = weight2.copy()
-                weight[selection] = 0.0
-                weight2[selection] = 0.0
+            if weight.dtype.kind == "f":      # integer and boolean weights can't be NaN
+                selection = numpy.isnan(weight)
+                if selection.any():
+                    weight = weight.copy()
+                    weight2 = weight2.copy()
+                    weight[selection] = 0.0
+                    weight2[selection] = 0.0
 
         def fillblock(content, indexes, axissumx, axissumx2, weight, weight2):
+            if self._flatcache is not None and self._flatcache[0] is content:
+                flat = self._flatcache[1]
+            else:
+                flat = content.reshape((-1, self._shape[-1]))
+                self._flatcache = (content, flat)
+            n = flat.shape[0]
+
+            if histbook._numba_kernels.available and weight2 is not None and len(self._profile) == 0 and indexes is not None:
+                # compiled single-pass scatter-add; masked events are skipped inline
+                mask = numpy.ma.getmask(indexes)
+                if mask is numpy.ma.nomask:
+                    histbook._numba_kernels.scatteradd2(numpy.ma.getdata(indexes), weight, weight2, flat, self._sumwindex, self._sumw2index)
+                else:
+                    histbook._numba_kernels.scatteradd2masked(numpy.ma.getdata(indexes), mask, weight, weight2, flat, self._sumwindex, self._sumw2index)
+                return
+
+            mask = None
+            if indexes is None and (len(self._profile) > 0 or weight2 is not None):
+                idx = numpy.zeros(len(axissumx[0]) if len(self._profile) > 0 else len(weight), dtype=histbook.calc.INDEXTYPE)
+                stop = n
+            elif indexes is not None:
+                mask = numpy.ma.getmask(indexes)
+                if mask is numpy.ma.nomask:
+                    mask = None
+                    idx = numpy.ma.getdata(indexes)
+                    stop = n
+                else:
+                    # route masked events to a discard slot just past the real bins, instead of
+                    # copying the indexes with compressed() and every weight array with a selection
+                    idx = numpy.where(mask, n, numpy.ma.getdata(indexes))
+                    stop = n + 1
+            else:
+                idx = None
+
             for sumx, sumx2, axis in zip(axissumx, axissumx2, self._profile):
-                if indexes is None:
-                    indexes = numpy.ma.zeros(len(sumx), dtype=histbook.calc.INDEXTYPE)
-                if weight2 is not None:
-                    selection = numpy.ma.getmask(indexes)
-                    if selection is not numpy.ma.nomask:
-                        selection = numpy.bitwise_not(selection)
-                        weight = weight[selection]
-                        weight2 = weight2[selection]
-                numpy.add.at(content.reshape((-1, self._shape[-1]))[:, axis._sumwxindex], indexes.compressed(), sumx * weight)
-                numpy.add.at(content.reshape((-1, self._shape[-1]))[:, axis._sumwx2index], indexes.compressed(), sumx2 * weight)
+                if weight2 is None:
+                    wsumx, wsumx2 = sumx, sumx2                    # weight is identically 1
+                else:
+                    wsumx, wsumx2 = sumx * weight, sumx2 * weight
+                if histbook._numba_kernels.available and idx is not None:
+                    # both columns in one pass: each event's row of content is touched once
+                    if mask is None:
+                        histbook._numba_kernels.scatteradd2(idx, wsumx, wsumx2, flat, axis._sumwxindex, axis._sumwx2index)
+                    else:
+                        histbook._numba_kernels.scatteradd2masked(idx, mask, wsumx, wsumx2, flat, axis._sumwxindex, axis._sumwx2index)
+                else:
+                    flat[:, axis._sumwxindex] += _bincount(idx, wsumx, stop)[:n]
+                    flat[:, axis._sumwx2index] += _bincount(idx, wsumx2, stop)[:n]
 
             if weight2 is None:
-                if indexes is None:
-                    content.reshape((-1, self._shape[-1]))[:, self._sumwindex] += (1 if length is None else length) * weight
+                if idx is None:
+                    flat[:, self._sumwindex] += (1 if length is None else length) * weight
                 else:
-                    numpy.add.at(content.reshape((-1, self._shape[-1]))[:, self._sumwindex], indexes.compressed(), weight)
+                    flat[:, self._sumwindex] += _bincount(idx, None, stop)[:n]
             else:
-                if indexes is None:
-                    indexes = numpy.ma.zeros(len(weight), dtype=histbook.calc.INDEXTYPE)
-                selection = numpy.ma.getmask(indexes)
-                if selection is not numpy.ma.nomask:
-                    selection = numpy.bitwise_not(selection)
-                    weight = weight[selection]
-                    weight2 = weight2[selection]
-                numpy.add.at(content.reshape((-1, self._shape[-1]))[:, self._sumwindex], indexes.compressed(), weight)
-                numpy.add.at(content.reshape((-1, self._shape[-1]))[:, self._sumw2index], indexes.compressed(), weight2)
-
-        def filldict(j, content, indexes, axissumx, axissumx2, weight, weight2, allselection):
+                if histbook._numba_kernels.available:
+                    if mask is None:
+                        histbook._numba_kernels.scatteradd2(idx, weight, weight2, flat, self._sumwindex, self._sumw2index)
+                    else:
+                        histbook._numba_kernels.scatteradd2masked(idx, mask, weight, weight2, flat, self._sumwindex, self._sumw2index)
+                else:
+                    flat[:, self._sumwindex] += _bincount(idx, weight, stop)[:n]
+                    flat[:, self._sumw2index] += _bincount(idx, weight2, stop)[:n]
+
+        def filldict(j, content, indexes, axissumx, axissumx2, weight, weight2, positions):
             if j == len(self._group):
                 fillblock(content, indexes, axissumx, axissumx2, weight, weight2)
 
             else:
                 uniques, inverse = self._destination[0][j]
+                if positions is not None:
+                    inverse = inverse[positions]
+
+                # partition with one stable sort instead of one boolean pass per unique value;
+                # slot zero of counts collects negative inverse entries (events dropped by the group axis)
+                order = numpy.argsort(inverse, kind="mergesort")
+                counts = numpy.bincount(inverse + 1, minlength=len(uniques) + 1)
+                offsets = numpy.cumsum(counts)
+
                 for idx, unique in enumerate(uniques):
-                    if allselection is None:
-                        selection = (inverse == idx)
-                    else:
-                        selection = (inverse[allselection] == idx)
-                    
+                    sub = order[offsets[idx]:offsets[idx + 1]]
+
                     if unique not in content:
                         if j + 1 == len(self._group):
                             content[unique] = numpy.zeros(self._shape, dtype=self.COUNTTYPE)
@@ -479,24 +627,18 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
 
                     subcontent = content[unique]
                     if indexes is None:
-                        subindexes = numpy.ma.zeros(numpy.count_nonzero(selection), dtype=histbook.calc.INDEXTYPE)
+                        subindexes = numpy.ma.zeros(len(sub), dtype=histbook.calc.INDEXTYPE)
                     else:
-                        subindexes = indexes[selection]
-                    subaxissumx = [x[selection] for x in axissumx]
-                    subaxissumx2 = [x[selection] for x in axissumx2]
+                        subindexes = indexes[sub]
+                    subaxissumx = [x[sub] for x in axissumx]
+                    subaxissumx2 = [x[sub] for x in axissumx2]
                     if weight2 is None:
                         subweight, subweight2 = weight, weight2
                     else:
-                        subweight = weight[selection]
-                        subweight2 = weight2[selection]
-
-                    if allselection is None:
-                        suballselection = selection
-                    else:
-                        suballselection = allselection.copy()
-                        suballselection[inverse != idx] = False
+                        subweight = weight[sub]
+                        subweight2 = weight2[sub]
 
-                    filldict(j + 1, subcontent, subindexes, subaxissumx, subaxissumx2, subweight, subweight2, suballselection)
+                    filldict(j + 1, subcontent, subindexes, subaxissumx, subaxissumx2, subweight, subweight2, sub if positions is None else positions[sub])
 
         filldict(0, self._content, indexes, axissumx, axissumx2, weight, weight2, None)
 
@@ -652,7 +794,7 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
         for x in hists.values():
             defs.update(x._defs)
 
-        out = cls(*((histbook.axis.groupby(by),) + hist._group + hist._fixed + hist._profile), weight=weight, filter=None, defs=dict(defs), attachment=None)
+        out = cls(*((histbook.axis.groupby(by),) + hist._group + hist._fixed + hist._profile), weight=weight, filter=None, defs=dict(defs), attachment=None, counttype=hist.COUNTTYPE)
         out._content = {}
         for n, x in hists.items():
             out._content[n] = cls._copycontent(x._content)
@@ -733,12 +875,20 @@ class Hist(histbook.fill.Fillable, histbook.proj.Projectable, histbook.export.Ex
 
     def __getstate__(self):
         packed = tuple(x._pack() for x in self._group + self._fixed + self._profile)
-        return (packed, self._weightoriginal, self._filteroriginal, None if len(self._defs) == 0 else self._defs, self._content, None if len(self._attachment) == 0 else self._attachment)
+        return (packed, self._weightoriginal, self._filteroriginal, None if len(self._defs) == 0 else self._defs, self._content, None if len(self._attachment) == 0 else self._attachment, numpy.dtype(self.COUNTTYPE).name)
 
     def __setstate__(self, state):
-        packed, weight, filter, defs, content, attachment = state
-        self.__init__(*[histbook.axis.Axis._unpack(x) for x in packed], weight=weight, filter=filter, defs=defs, attachment=attachment)
+        if len(state) == 6:
+            state = state + (None,)    # pickles from before counttype was part of the state
+        packed, weight, filter, defs, content, attachment, counttype = state
+        self.__init__(*[histbook.axis.Axis._unpack(x) for x in packed], weight=weight, filter=filter, defs=defs, attachment=attachment, counttype=counttype)
         self._content = content
+        if counttype is None:
+            node = content
+            while isinstance(node, dict) and len(node) > 0:
+                node = next(iter(node.values()))
+            if isinstance(node, numpy.ndarray):
+                self.COUNTTYPE = node.dtype.type    # old pickles: infer a non-default counttype from the content
 
     def __eq__(self, other):
         def recurse(one, two):
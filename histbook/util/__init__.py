@@ -45,3 +45,21 @@ class ChainedDict(object):
             return self._two[n]    # and it has precedence
         else:
             return self._one[n]    # self._one might only have __getitem__
+
+class SlicedDict(object):
+    def __init__(self, arrays, length, start, stop):
+        self._arrays = arrays      # might only have __getitem__
+        self._length = length
+        self._start = start
+        self._stop = stop
+
+    def __getitem__(self, n):
+        x = self._arrays[n]
+        if isinstance(x, (string, bytes)):
+            return x
+        try:
+            if len(x) == self._length:
+                return x[self._start:self._stop]
+        except TypeError:
+            pass
+        return x                   # scalars and mismatched lengths pass through unsliced
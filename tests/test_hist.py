@@ -391,6 +391,11 @@ class TestHist(unittest.TestCase):
         h.fill(x=[10.4, 10.3, 10.3, 10.5, 10.4, 10.8], y=[0.1, 0.1, 0.1, 0.1, 0.1, 1.0])
         self.assertEqual(h._content.tolist(), [[0.0, 0.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0, 0.0], [0.2, 0.020000000000000004, 0.4, 0.08000000000000002, 2.0], [0.2, 0.020000000000000004, 0.4, 0.08000000000000002, 2.0], [0.1, 0.010000000000000002, 0.2, 0.04000000000000001, 1.0], [0.0, 0.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0, 0.0], [1.0, 1.0, 2.0, 4.0, 1.0], [0.0, 0.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0, 0.0]])
 
+    def test_profile_masked_weight(self):
+        h = Hist(bin("x", 2, 0, 2, underflow=False, overflow=False, nanflow=False), profile("y"), weight="w")
+        h.fill(x=[-1.0, 0.5, 1.5, 5.0, 0.5], y=[10.0, 1.0, 2.0, 99.0, 3.0], w=[7.0, 1.0, 1.0, 7.0, 1.0])
+        self.assertEqual(h._content.tolist(), [[4.0, 10.0, 2.0, 2.0], [2.0, 4.0, 1.0, 1.0]])
+
     def test_groupby(self):
         h = Hist(groupby("c"), bin("x", 3, 1.0, 4.0, underflow=False, overflow=False, nanflow=False))
         h.fill(c=["one", "two", "three", "two", "one", "one", "one"], x=[1, 2, 3, 2, 1, 1, 3])
@@ -434,6 +439,91 @@ class TestHist(unittest.TestCase):
         self.assertEqual(h._content[10.0]["two"].tolist(), [[0], [0], [1], [0]])
         self.assertEqual(h._content[20.0]["two"].tolist(), [[0], [0], [0], [1]])
 
+    def test_chunked_fill(self):
+        import histbook.fill
+
+        x = numpy.arange(250) % 10 * 0.1
+        y = numpy.arange(250) * 1.0
+        w = numpy.ones(250)
+        c = numpy.where(numpy.arange(250) % 2 == 0, "even", "odd")
+
+        whole = Hist(groupby("c"), groupby("s"), bin("x", 10, 0, 1), profile("y"), weight="w")
+        whole.fill(c=c, s="only", x=x, y=y, w=w)
+
+        chunked = Hist(groupby("c"), groupby("s"), bin("x", 10, 0, 1), profile("y"), weight="w")
+        tmp = histbook.fill.CHUNKSIZE
+        try:
+            histbook.fill.CHUNKSIZE = 100
+            chunked.fill({"c": c, "s": "only", "x": x}, y=y, w=w)
+            self.assertEqual(whole, chunked)
+
+            h = Hist(bin("x", 10, 0, 1), weight="w")
+            h.fill(x=x, w=w)
+            before = h._content.tolist()
+            self.assertRaises(ValueError, lambda: h.fill(x=x, w=numpy.ones(100)))
+            self.assertRaises(ValueError, lambda: h.fill(x=x, w=numpy.ones(99)))
+            self.assertEqual(h._content.tolist(), before)
+        finally:
+            histbook.fill.CHUNKSIZE = tmp
+
+    def test_parallel_bincount(self):
+        import histbook.hist
+        import histbook._numba_kernels
+
+        x = numpy.arange(1000) % 10 * 0.1 - 0.2
+        w = numpy.arange(1000) % 3 * 1.0
+
+        expect1 = Hist(bin("x", 5, 0, 1))
+        expect1.fill(x=x)
+        expect2 = Hist(bin("x", 5, 0, 1, underflow=False, overflow=False, nanflow=False), weight="w")
+        expect2.fill(x=x, w=w)
+
+        tmp = histbook.hist.PARALLELMIN, histbook.hist.FILLTHREADS, histbook._numba_kernels.available
+        try:
+            histbook.hist.PARALLELMIN = 10
+            histbook.hist.FILLTHREADS = 3
+            histbook._numba_kernels.available = False    # force the bincount paths
+
+            h1 = Hist(bin("x", 5, 0, 1))
+            h1.fill(x=x)
+            self.assertEqual(h1, expect1)
+
+            # masked flow bins exercise the discard-slot minlength
+            h2 = Hist(bin("x", 5, 0, 1, underflow=False, overflow=False, nanflow=False), weight="w")
+            h2.fill(x=x, w=w)
+            self.assertEqual(h2, expect2)
+        finally:
+            histbook.hist.PARALLELMIN, histbook.hist.FILLTHREADS, histbook._numba_kernels.available = tmp
+
+    def test_counttype(self):
+        h = Hist(bin("x", 4, 0, 1), profile("y"), weight="w", counttype=numpy.float32)
+        h.fill(x=[0.1, 0.5, 0.5], y=[1.0, 2.0, 3.0], w=[1.0, 2.0, 3.0])
+        self.assertEqual(h._content.dtype, numpy.dtype(numpy.float32))
+        self.assertEqual(h.weight("w").COUNTTYPE, numpy.float32)
+        self.assertEqual(h.cleared().COUNTTYPE, numpy.float32)
+        self.assertEqual(pickle.loads(pickle.dumps(h)).COUNTTYPE, numpy.float32)
+        self.assertEqual(pickle.loads(pickle.dumps(h.cleared())).COUNTTYPE, numpy.float32)    # unfilled, too
+
+        proj = h.project("x")
+        self.assertEqual(proj._content.dtype, numpy.dtype(numpy.float32))
+        self.assertEqual(proj.cleared().COUNTTYPE, numpy.float32)
+        self.assertEqual(h.select("x >= 0.5").COUNTTYPE, numpy.float32)
+
+        h2 = Hist(groupby("c"), bin("x", 3, 0, 1), counttype=numpy.float32)
+        h2.fill(c=["a", "b", "a"], x=[0.1, 0.5, 0.9])
+        self.assertEqual(h2._content["a"].dtype, numpy.dtype(numpy.float32))
+
+        # integer counts would truncate weighted fills (or fail outright on the bincount paths)
+        self.assertRaises(TypeError, lambda: Hist(bin("x", 3, 0, 1), counttype=numpy.int64))
+
+        one = Hist(bin("x", 3, 0, 1), counttype=numpy.float32)
+        one.fill(x=[0.1])
+        two = Hist(bin("x", 3, 0, 1), counttype=numpy.float32)
+        two.fill(x=[0.5])
+        grouped = Hist.group(one=one, two=two)
+        self.assertEqual(grouped.COUNTTYPE, numpy.float32)
+        self.assertEqual(grouped._content["one"].dtype, numpy.dtype(numpy.float32))
+
     def test_pickle(self):
         h = Hist(split("x", (1, 2, 3)), bin("y", 10, 0, 1), defs={"y": "x + 0.1"}, weight="sqrt(x)", filter="x > 2")
         self.assertEqual(h, pickle.loads(pickle.dumps(h)))